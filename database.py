@@ -1,19 +1,23 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, event, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
 import aiosqlite
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 Base = declarative_base()
 
+# Timestamp evaluated by SQLite inside the INSERT/UPDATE. CURRENT_TIMESTAMP would be UTC with
+# second precision, so keep local time with milliseconds like the previous datetime.now() values.
+def local_now():
+    return func.strftime("%Y-%m-%d %H:%M:%f", "now", "localtime")
+
 class Template(Base):
     __tablename__ = "templates"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
-    created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=local_now())
+    updated_at = Column(DateTime, default=local_now(), onupdate=local_now())
     
     sections = relationship("TemplateSection", back_populates="template", cascade="all, delete-orphan")
     prompts = relationship("Prompt", back_populates="template")
@@ -22,12 +26,12 @@ class TemplateSection(Base):
     __tablename__ = "template_sections"
     
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("templates.id"))
+    template_id = Column(Integer, ForeignKey("templates.id"), index=True)
     level = Column(Integer, nullable=False)  # 1, 2, 3 for #, ##, ###
     title = Column(String(255), nullable=False)
     content = Column(Text)  # placeholder content
     order_index = Column(Integer, nullable=False)  # for ordering sections
-    parent_id = Column(Integer, ForeignKey("template_sections.id"), nullable=True)
+    parent_id = Column(Integer, ForeignKey("template_sections.id"), nullable=True, index=True)
     
     template = relationship("Template", back_populates="sections")
 
@@ -35,10 +39,10 @@ class Prompt(Base):
     __tablename__ = "prompts"
     
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("templates.id"))
+    template_id = Column(Integer, ForeignKey("templates.id"), index=True)
     title = Column(String(255), nullable=False)
     generated_content = Column(Text, nullable=False)  # Final markdown content
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=local_now())
     
     template = relationship("Template", back_populates="prompts")
     contents = relationship("PromptContent", back_populates="prompt", cascade="all, delete-orphan")
@@ -48,7 +52,7 @@ class PromptContent(Base):
     __tablename__ = "prompt_contents" 
     
     id = Column(Integer, primary_key=True, index=True)
-    prompt_id = Column(Integer, ForeignKey("prompts.id"))
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), index=True)
     section_id = Column(Integer, ForeignKey("template_sections.id"))
     content = Column(Text, nullable=False)
     
@@ -59,10 +63,10 @@ class GeminiResponse(Base):
     __tablename__ = "gemini_responses"
     
     id = Column(Integer, primary_key=True, index=True)
-    prompt_id = Column(Integer, ForeignKey("prompts.id"))
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), index=True)
     response_content = Column(Text, nullable=False)
     status = Column(String(50), default="pending")  # pending, completed, error
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=local_now())
     completed_at = Column(DateTime, nullable=True)
     
     prompt = relationship("Prompt", back_populates="gemini_response")
@@ -70,12 +74,32 @@ class GeminiResponse(Base):
 # Database configuration
 DATABASE_URL = "sqlite+aiosqlite:///./prompt_service.db"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+engine = create_async_engine(DATABASE_URL, echo=False, connect_args={"timeout": 30})
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragma(dbapi_conn, connection_record):
+    # WAL lets readers proceed while a writer is active; NORMAL sync is safe under WAL
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+# Writes flush/commit explicitly, so skip the autoflush pass before every query
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+def create_missing_indexes(sync_conn):
+    # create_all skips existing tables, so add indexes that older DB files lack
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
 
 async def get_db():
     async with async_session() as session:
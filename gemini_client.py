@@ -1,4 +1,3 @@
-import asyncio
 import os
 from typing import AsyncGenerator
 
@@ -18,14 +17,10 @@ class GeminiClient:
     async def generate_content_async(self, prompt: str, model: str = None) -> str:
         """비동기로 Gemini API 호출"""
         try:
-            # 동기 API를 비동기로 래핑
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.models.generate_content(
-                    model=model,
-                    contents=prompt,
-                )
+            # SDK의 네이티브 비동기 인터페이스 사용 (스레드풀 경유 없음)
+            response = await self.client.aio.models.generate_content(
+                model=model,
+                contents=prompt,
             )
             return response.text
         except Exception as e:
@@ -35,21 +30,14 @@ class GeminiClient:
         str, None]:
         """스트리밍 방식으로 Gemini API 호출"""
         try:
-            loop = asyncio.get_event_loop()
-            response_stream = await loop.run_in_executor(
-                None,
-                lambda: self.client.models.generate_content_stream(
-                    model=model,
-                    contents=prompt
-                )
+            response_stream = await self.client.aio.models.generate_content_stream(
+                model=model,
+                contents=prompt
             )
 
-            for chunk in response_stream:
-                yield chunk.text
+            async for chunk in response_stream:
+                if chunk.text:
+                    yield chunk.text
 
         except Exception as e:
             raise Exception(f"Gemini API 스트림 호출 실패: {str(e)}")
-
-
-# 전역 클라이언트 인스턴스
-gemini_client = GeminiClient()
@@ -1,14 +1,20 @@
+import asyncio
 import os
+import time
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 
 from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from database import get_db, create_tables
-from gemini_client import gemini_client
+from database import GeminiResponse, async_session, get_db, create_tables
+from gemini_client import GeminiClient
 from models import *
 from services import TemplateService, PromptService, GeminiService
 
@@ -17,15 +23,30 @@ from services import TemplateService, PromptService, GeminiService
 async def lifespan(app: FastAPI):
     # Startup
     await create_tables()
+    # 실행 중인 이벤트 루프에서 Gemini 클라이언트를 한 번만 생성해 재사용
+    app.state.gemini_client = GeminiClient()
     yield
     # Shutdown (if needed)
 
 
-app = FastAPI(title="프롬프트 템플릿 생성 서비스", lifespan=lifespan)
+app = FastAPI(title="프롬프트 템플릿 생성 서비스", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # 정적 파일과 템플릿 설정
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+
+# 템플릿 재파싱을 피하기 위해 자동 리로드를 끄고 바이트코드 캐시 사용
+os.makedirs(".jinja_cache", exist_ok=True)
+jinja_env = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    auto_reload=False,
+    bytecode_cache=FileSystemBytecodeCache(".jinja_cache"),
+    cache_size=400
+)
+templates = Jinja2Templates(env=jinja_env)
+
+# 목록 API 응답을 한 번에 검증/직렬화하는 어댑터
+prompt_list_adapter = TypeAdapter(List[PromptListResponse])
 
 
 # HTML 페이지 라우트
@@ -38,8 +59,8 @@ async def main_page(request: Request):
 @app.get("/templates", response_class=HTMLResponse)
 async def templates_page(request: Request, db: AsyncSession = Depends(get_db)):
     """템플릿 목록 페이지"""
-    templates_list = await TemplateService.get_templates(db)
-    return templates.TemplateResponse("templates.html", {
+    templates_list = await TemplateService.get_templates_list(db)
+    return await run_in_threadpool(templates.TemplateResponse, "templates.html", {
         "request": request,
         "templates": templates_list
     })
@@ -67,8 +88,8 @@ async def edit_template_page(request: Request, template_id: int, db: AsyncSessio
 @app.get("/prompts/create", response_class=HTMLResponse)
 async def create_prompt_page(request: Request, db: AsyncSession = Depends(get_db)):
     """프롬프트 생성 페이지 - 템플릿 선택"""
-    templates_list = await TemplateService.get_templates(db)
-    return templates.TemplateResponse("select_template.html", {
+    templates_list = await TemplateService.get_templates_list(db)
+    return await run_in_threadpool(templates.TemplateResponse, "select_template.html", {
         "request": request,
         "templates": templates_list
     })
@@ -90,21 +111,9 @@ async def create_prompt_form_page(request: Request, template_id: int, db: AsyncS
 @app.get("/prompts", response_class=HTMLResponse)
 async def prompts_page(request: Request, db: AsyncSession = Depends(get_db)):
     """생성 내역 페이지"""
-    prompts = await PromptService.get_prompts(db)
-
-    # Gemini 응답 상태 정보 추가
-    prompt_list = []
-    for prompt in prompts:
-        prompt_data = {
-            "id": prompt.id,
-            "title": prompt.title,
-            "created_at": prompt.created_at,
-            "has_gemini_response": prompt.gemini_response is not None,
-            "gemini_status": prompt.gemini_response.status if prompt.gemini_response else None
-        }
-        prompt_list.append(prompt_data)
-
-    return templates.TemplateResponse("prompts.html", {
+    prompt_list = await PromptService.get_prompts(db)
+
+    return await run_in_threadpool(templates.TemplateResponse, "prompts.html", {
         "request": request,
         "prompts": prompt_list
     })
@@ -136,7 +145,8 @@ async def gemini_response_page(request: Request, prompt_id: int, db: AsyncSessio
     return templates.TemplateResponse("gemini_response.html", {
         "request": request,
         "prompt": prompt,
-        "gemini_response": prompt.gemini_response
+        "gemini_response": prompt.gemini_response,
+        "stalled": is_gemini_stalled(prompt.gemini_response)
     })
 
 
@@ -154,7 +164,7 @@ async def create_template_api(template_data: TemplateCreate, db: AsyncSession =
 @app.get("/api/templates", response_model=List[TemplateListResponse])
 async def get_templates_api(db: AsyncSession = Depends(get_db)):
     """템플릿 목록 조회 API"""
-    templates_list = await TemplateService.get_templates(db)
+    templates_list = await TemplateService.get_templates_list(db)
     return templates_list
 
 
@@ -198,21 +208,12 @@ async def create_prompt_api(prompt_data: PromptCreate, db: AsyncSession = Depend
 @app.get("/api/prompts", response_model=List[PromptListResponse])
 async def get_prompts_api(db: AsyncSession = Depends(get_db)):
     """프롬프트 목록 조회 API"""
-    prompts = await PromptService.get_prompts(db)
-
-    # Gemini 응답 상태 정보 추가
-    prompt_list = []
-    for prompt in prompts:
-        prompt_data = {
-            "id": prompt.id,
-            "title": prompt.title,
-            "created_at": prompt.created_at,
-            "has_gemini_response": prompt.gemini_response is not None,
-            "gemini_status": prompt.gemini_response.status if prompt.gemini_response else None
-        }
-        prompt_list.append(prompt_data)
+    prompt_list = await PromptService.get_prompts(db)
 
-    return prompt_list
+    return Response(
+        content=prompt_list_adapter.dump_json(prompt_list_adapter.validate_python(prompt_list)),
+        media_type="application/json"
+    )
 
 
 @app.get("/api/prompts/{prompt_id}", response_model=PromptResponse)
@@ -233,41 +234,129 @@ async def delete_prompt_api(prompt_id: int, db: AsyncSession = Depends(get_db)):
     return {"message": "프롬프트가 성공적으로 삭제되었습니다"}
 
 
-async def process_gemini_request(prompt_id: int, prompt_content: str, db: AsyncSession):
-    """백그라운드에서 Gemini API 호출 처리"""
-    try:
-        # Gemini 응답 레코드 생성
-        gemini_response = await GeminiService.create_gemini_response(db, prompt_id)
+# 스트리밍 응답을 DB에 반영하는 기준 (바이트 수 / 초)
+GEMINI_FLUSH_BYTES = 512
+GEMINI_FLUSH_INTERVAL = 0.5
 
-        # Gemini API 호출
-        response_content = await gemini_client.generate_content_async(prompt_content, os.getenv("GEMINI_MODEL"))
+# 생성 최대 시간(초) - 이 시간이 지나도 pending인 응답은 중단된 것으로 간주
+GEMINI_TIMEOUT = 600
+# 스트리밍 API가 새 내용 없이 기다리는 최대 시간(초)
+GEMINI_STREAM_IDLE_TIMEOUT = 120
 
-        # 응답 업데이트
-        await GeminiService.update_gemini_response(
-            db, gemini_response.id, response_content, "completed"
-        )
 
-    except Exception as e:
-        # 에러 발생 시 상태 업데이트
-        if 'gemini_response' in locals():
-            await GeminiService.update_gemini_response(
-                db, gemini_response.id, str(e), "error"
+def is_gemini_stalled(gemini_response: GeminiResponse) -> bool:
+    """pending 상태로 제한 시간을 넘긴 응답인지 확인 (작업 중단, 프로세스 재시작 등)"""
+    return (
+        gemini_response.status == "pending"
+        and gemini_response.created_at < datetime.now() - timedelta(seconds=GEMINI_TIMEOUT)
+    )
+
+
+async def stream_gemini_to_db(db: AsyncSession, gemini_client: GeminiClient, response_id: int, prompt_content: str):
+    """Gemini API 스트리밍 호출 - 일정 크기/시간마다 모아서 DB에 이어붙여 부분 결과 조회 가능"""
+    buf = []
+    buffered_bytes = 0
+    last_flush = time.monotonic()
+    async for chunk in gemini_client.generate_content_stream_async(prompt_content, os.getenv("GEMINI_MODEL")):
+        buf.append(chunk)
+        buffered_bytes += len(chunk.encode())
+        if buffered_bytes >= GEMINI_FLUSH_BYTES or time.monotonic() - last_flush >= GEMINI_FLUSH_INTERVAL:
+            await GeminiService.append_chunks(db, response_id, "".join(buf))
+            buf.clear()
+            buffered_bytes = 0
+            last_flush = time.monotonic()
+
+    # 남은 조각과 완료 상태를 한 번에 업데이트
+    await GeminiService.append_chunks(db, response_id, "".join(buf), "completed")
+
+
+async def process_gemini_request(gemini_client: GeminiClient, response_id: int, prompt_content: str):
+    """백그라운드에서 Gemini API 호출 처리"""
+    # 요청 스코프 세션은 응답 후 닫히므로 백그라운드 작업 전용 세션을 사용
+    async with async_session() as db:
+        try:
+            # 제한 시간 안에 끝나지 않으면 중단하고 에러로 기록
+            await asyncio.wait_for(
+                stream_gemini_to_db(db, gemini_client, response_id, prompt_content), timeout=GEMINI_TIMEOUT
             )
 
+        except Exception as e:
+            # 에러 발생 시 상태 업데이트
+            if isinstance(e, asyncio.TimeoutError):
+                message = "Gemini 응답 시간이 초과되었습니다"
+            else:
+                message = str(e)
+            await db.rollback()
+            await GeminiService.update_gemini_response(db, response_id, message, "error")
+
 
 @app.post("/api/prompts/{prompt_id}/gemini")
-async def submit_to_gemini_api(prompt_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+async def submit_to_gemini_api(request: Request, prompt_id: int, background_tasks: BackgroundTasks,
+                               db: AsyncSession = Depends(get_db)):
     """Gemini API로 프롬프트 제출"""
     prompt = await PromptService.get_prompt_by_id(db, prompt_id)
     if not prompt:
         raise HTTPException(status_code=404, detail="프롬프트를 찾을 수 없습니다")
 
+    # 응답 레코드를 먼저 pending으로 준비 - 생성 중인 응답에 다른 작업이 이어붙이지 않도록 중복 요청 거절
+    response_id = await GeminiService.start_gemini_response(
+        db, prompt_id, stale_before=datetime.now() - timedelta(seconds=GEMINI_TIMEOUT)
+    )
+    if response_id is None:
+        raise HTTPException(status_code=409, detail="이미 Gemini 응답을 생성 중입니다")
+
     # 백그라운드 태스크로 Gemini API 호출
-    background_tasks.add_task(process_gemini_request, prompt_id, prompt.generated_content, db)
+    background_tasks.add_task(
+        process_gemini_request, request.app.state.gemini_client, response_id, prompt.generated_content
+    )
 
     return {"message": "Gemini API 요청이 시작되었습니다"}
 
 
+async def tail_gemini_response(response_id: int):
+    """백그라운드 작업이 DB에 기록하는 응답을 따라가며 새로 추가된 부분만 전달"""
+    offset = 0
+    started = last_content = time.monotonic()
+    async with async_session() as db:
+        while True:
+            progress = await GeminiService.get_gemini_progress(db, response_id, offset)
+            # 다음 조회에서 새 스냅샷을 보도록 읽기 트랜잭션 종료
+            await db.rollback()
+            if not progress or progress.status == "error":
+                return
+
+            if progress.new_content:
+                offset += len(progress.new_content)
+                last_content = time.monotonic()
+                yield progress.new_content
+
+            if progress.status != "pending":
+                return
+
+            # 작업이 중단되어 pending으로 남은 경우 무한히 기다리지 않도록 제한
+            now = time.monotonic()
+            if now - last_content >= GEMINI_STREAM_IDLE_TIMEOUT or now - started >= GEMINI_TIMEOUT:
+                return
+
+            await asyncio.sleep(GEMINI_FLUSH_INTERVAL)
+
+
+@app.get("/api/prompts/{prompt_id}/gemini/stream")
+async def stream_gemini_api(prompt_id: int, db: AsyncSession = Depends(get_db)):
+    """Gemini 응답 스트리밍 API - 새 생성 없이 진행 중인 응답을 실시간으로 전달"""
+    prompt = await PromptService.get_prompt_by_id(db, prompt_id)
+    if not prompt:
+        raise HTTPException(status_code=404, detail="프롬프트를 찾을 수 없습니다")
+
+    if not prompt.gemini_response:
+        raise HTTPException(status_code=404, detail="Gemini 응답을 찾을 수 없습니다")
+
+    return StreamingResponse(
+        tail_gemini_response(prompt.gemini_response.id),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 @app.get("/api/prompts/{prompt_id}/gemini", response_model=GeminiResponseResponse)
 async def get_gemini_response_api(prompt_id: int, db: AsyncSession = Depends(get_db)):
     """Gemini 응답 조회 API"""
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from datetime import datetime
 
@@ -17,8 +17,7 @@ class TemplateSectionResponse(BaseModel):
     order_index: int
     parent_id: Optional[int]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TemplateCreate(BaseModel):
     title: str
@@ -31,16 +30,14 @@ class TemplateResponse(BaseModel):
     updated_at: datetime
     sections: List[TemplateSectionResponse]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TemplateListResponse(BaseModel):
     id: int
     title: str
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PromptContentCreate(BaseModel):
     section_id: int
@@ -57,8 +54,7 @@ class PromptContentResponse(BaseModel):
     content: str
     section: TemplateSectionResponse
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PromptResponse(BaseModel):
     id: int
@@ -68,8 +64,7 @@ class PromptResponse(BaseModel):
     created_at: datetime
     contents: List[PromptContentResponse]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PromptListResponse(BaseModel):
     id: int
@@ -78,8 +73,7 @@ class PromptListResponse(BaseModel):
     has_gemini_response: bool
     gemini_status: Optional[str]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class GeminiResponseCreate(BaseModel):
     prompt_id: int
@@ -92,5 +86,4 @@ class GeminiResponseResponse(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
@@ -1,46 +1,81 @@
 from datetime import datetime
-from typing import List, Optional
+from operator import attrgetter
+from typing import List, Optional, Sequence
 
-from sqlalchemy import select, delete
+from cachetools import TTLCache
+from sqlalchemy import Row, select, delete, func, insert, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, joinedload, selectinload
 
-from database import Template, TemplateSection, Prompt, PromptContent, GeminiResponse
-from models import TemplateCreate, PromptCreate
+from database import Template, TemplateSection, Prompt, PromptContent, GeminiResponse, local_now
+from models import TemplateCreate, TemplateSectionCreate, TemplateResponse, TemplateSectionResponse, PromptCreate
+
+
+# template_id -> TemplateResponse, invalidated on update/delete
+_template_cache = TTLCache(maxsize=256, ttl=30)
+
+# Markdown header prefixes for the supported section levels (1, 2, 3)
+_HEADERS = {level: "#" * level + " " for level in range(1, 4)}
 
 
 class TemplateService:
     @staticmethod
-    async def create_template(db: AsyncSession, template_data: TemplateCreate) -> Template:
+    async def create_template(db: AsyncSession, template_data: TemplateCreate) -> TemplateResponse:
         # Create template
         template = Template(title=template_data.title)
         db.add(template)
         await db.flush()  # Get template.id
 
         # Create sections
-        for section_data in template_data.sections:
-            section = TemplateSection(
-                template_id=template.id,
-                level=section_data.level,
-                title=section_data.title,
-                content=section_data.content,
-                order_index=section_data.order_index,
-                parent_id=section_data.parent_id
-            )
-            db.add(section)
+        sections = await TemplateService._insert_sections(db, template.id, template_data.sections)
 
         await db.commit()
 
-        # 관계된 데이터를 다시 조회해서 반환
+        # 재조회 없이 알고 있는 값으로 응답 구성
+        return TemplateResponse(
+            id=template.id,
+            title=template.title,
+            created_at=template.created_at,
+            updated_at=template.updated_at,
+            sections=sections
+        )
+
+    @staticmethod
+    async def _insert_sections(db: AsyncSession, template_id: int,
+                               sections_data: List[TemplateSectionCreate]) -> List[TemplateSectionResponse]:
+        if not sections_data:
+            return []
+
+        rows = [{"template_id": template_id, **section_data.model_dump()} for section_data in sections_data]
+
+        # 한 번의 executemany로 모든 섹션 삽입, 입력 순서대로 id 반환
         result = await db.execute(
-            select(Template)
-            .options(selectinload(Template.sections))
-            .where(Template.id == template.id)
+            insert(TemplateSection).returning(TemplateSection.id, sort_by_parameter_order=True),
+            rows
+        )
+        return [
+            TemplateSectionResponse(id=section_id, **section_data.model_dump())
+            for section_id, section_data in zip(result.scalars().all(), sections_data)
+        ]
+
+    @staticmethod
+    async def get_templates_list(db: AsyncSession) -> Sequence[Row]:
+        # 목록 화면에 필요한 컬럼과 섹션 개수만 조회 (섹션 전체 로딩 없음)
+        result = await db.execute(
+            select(
+                Template.id,
+                Template.title,
+                Template.created_at,
+                func.count(TemplateSection.id).label("section_count")
+            )
+            .outerjoin(Template.sections)
+            .group_by(Template.id)
+            .order_by(Template.created_at.desc())
         )
-        return result.scalar_one()
+        return result.all()
 
     @staticmethod
-    async def get_templates(db: AsyncSession) -> List[Template]:
+    async def get_templates_with_sections(db: AsyncSession) -> List[Template]:
         result = await db.execute(
             select(Template)
             .options(selectinload(Template.sections))
@@ -49,7 +84,22 @@ class TemplateService:
         return result.scalars().all()
 
     @staticmethod
-    async def get_template_by_id(db: AsyncSession, template_id: int) -> Optional[Template]:
+    async def get_template_by_id(db: AsyncSession, template_id: int) -> Optional[TemplateResponse]:
+        # 템플릿은 거의 바뀌지 않으므로 변환된 응답 객체를 잠시 메모리에 보관
+        cached = _template_cache.get(template_id)
+        if cached is not None:
+            return cached
+
+        template = await TemplateService._get_template_model(db, template_id)
+        if not template:
+            return None
+
+        response = TemplateResponse.model_validate(template)
+        _template_cache[template_id] = response
+        return response
+
+    @staticmethod
+    async def _get_template_model(db: AsyncSession, template_id: int) -> Optional[Template]:
         result = await db.execute(
             select(Template)
             .options(selectinload(Template.sections))
@@ -58,48 +108,45 @@ class TemplateService:
         return result.scalar_one_or_none()
 
     @staticmethod
-    async def update_template(db: AsyncSession, template_id: int, template_data: TemplateCreate) -> Optional[Template]:
-        template = await TemplateService.get_template_by_id(db, template_id)
-        if not template:
+    async def update_template(db: AsyncSession, template_id: int, template_data: TemplateCreate) -> Optional[TemplateResponse]:
+        # Update template title - 존재 확인과 타임스탬프 조회를 RETURNING으로 한 번에 처리
+        result = await db.execute(
+            update(Template)
+            .where(Template.id == template_id)
+            .values(title=template_data.title)
+            .returning(Template.created_at, Template.updated_at)
+        )
+        timestamps = result.one_or_none()
+        if not timestamps:
             return None
 
-        # Update template title
-        template.title = template_data.title
-        template.updated_at = datetime.now()
-
         # Delete existing sections
         await db.execute(delete(TemplateSection).where(TemplateSection.template_id == template_id))
 
         # Create new sections
-        for section_data in template_data.sections:
-            section = TemplateSection(
-                template_id=template.id,
-                level=section_data.level,
-                title=section_data.title,
-                content=section_data.content,
-                order_index=section_data.order_index,
-                parent_id=section_data.parent_id
-            )
-            db.add(section)
+        sections = await TemplateService._insert_sections(db, template_id, template_data.sections)
 
         await db.commit()
-
-        # 관계된 데이터를 다시 조회해서 반환
-        result = await db.execute(
-            select(Template)
-            .options(selectinload(Template.sections))
-            .where(Template.id == template.id)
+        _template_cache.pop(template_id, None)
+
+        # 변경한 값으로 응답 구성 (재조회 없음)
+        return TemplateResponse(
+            id=template_id,
+            title=template_data.title,
+            created_at=timestamps.created_at,
+            updated_at=timestamps.updated_at,
+            sections=sections
         )
-        return result.scalar_one()
 
     @staticmethod
     async def delete_template(db: AsyncSession, template_id: int) -> bool:
-        template = await TemplateService.get_template_by_id(db, template_id)
+        template = await TemplateService._get_template_model(db, template_id)
         if not template:
             return False
 
         await db.delete(template)
         await db.commit()
+        _template_cache.pop(template_id, None)
         return True
 
 
@@ -123,106 +170,134 @@ class PromptService:
         db.add(prompt)
         await db.flush()
 
-        # Create prompt contents
-        for content_data in prompt_data.contents:
-            content = PromptContent(
-                prompt_id=prompt.id,
-                section_id=content_data.section_id,
-                content=content_data.content
+        # Create prompt contents in a single executemany
+        if prompt_data.contents:
+            await db.execute(
+                insert(PromptContent),
+                [
+                    {"prompt_id": prompt.id, "section_id": content_data.section_id, "content": content_data.content}
+                    for content_data in prompt_data.contents
+                ]
             )
-            db.add(content)
 
         await db.commit()
 
         # 관계된 데이터를 다시 조회해서 반환
         result = await db.execute(
             select(Prompt)
-            .options(
-                selectinload(Prompt.contents).selectinload(PromptContent.section),
-                selectinload(Prompt.template)
-            )
+            .options(joinedload(Prompt.contents).joinedload(PromptContent.section))
             .where(Prompt.id == prompt.id)
         )
-        return result.scalar_one()
+        return result.unique().scalar_one()
 
     @staticmethod
-    async def generate_markdown(template: Template, contents_data: List) -> str:
+    async def generate_markdown(template: TemplateResponse, contents_data: List) -> str:
         # Create a mapping of section_id to content
         content_map = {content.section_id: content.content for content in contents_data}
 
-        # Sort sections by order_index
-        sections = sorted(template.sections, key=lambda x: x.order_index)
-
-        markdown_lines = []
+        parts = []
+        extend = parts.extend
 
-        for section in sections:
+        # Sort sections by order_index
+        for section in sorted(template.sections, key=attrgetter("order_index")):
             # Add markdown header based on level
-            header = "#" * section.level
-            markdown_lines.append(f"{header} {section.title}")
+            header = _HEADERS.get(section.level) or "#" * section.level + " "
 
-            # Add content if exists
-            if section.id in content_map and content_map[section.id].strip():
-                markdown_lines.append(content_map[section.id])
-            elif section.content and section.content.strip():
-                # Use placeholder content if no user content provided
-                markdown_lines.append(section.content)
+            # Use placeholder content if no user content provided
+            content = content_map.get(section.id)
+            if not (content and content.strip()):
+                content = section.content if section.content and section.content.strip() else None
 
-            markdown_lines.append("")  # Add empty line
+            if content:
+                extend((header, section.title, "\n", content, "\n\n"))
+            else:
+                extend((header, section.title, "\n\n"))
 
-        return "\n".join(markdown_lines).strip()
+        return "".join(parts).strip()
 
     @staticmethod
-    async def get_prompts(db: AsyncSession) -> List[Prompt]:
+    async def get_prompts(db: AsyncSession) -> Sequence[Row]:
+        # 목록 화면에 필요한 컬럼만 한 번의 쿼리로 조회
+        # prompt_id에 유니크 제약이 없으므로 프롬프트당 최신 응답 하나만 조인
+        latest = aliased(GeminiResponse)
+        latest_response_id = (
+            select(func.max(latest.id))
+            .where(latest.prompt_id == Prompt.id)
+            .correlate(Prompt)
+            .scalar_subquery()
+        )
         result = await db.execute(
-            select(Prompt)
-            .options(selectinload(Prompt.gemini_response))
+            select(
+                Prompt.id,
+                Prompt.title,
+                Prompt.created_at,
+                GeminiResponse.id.is_not(None).label("has_gemini_response"),
+                GeminiResponse.status.label("gemini_status")
+            )
+            .outerjoin(
+                GeminiResponse,
+                (GeminiResponse.prompt_id == Prompt.id) & (GeminiResponse.id == latest_response_id)
+            )
             .order_by(Prompt.created_at.desc())
         )
-        return result.scalars().all()
+        return result.all()
 
     @staticmethod
     async def get_prompt_by_id(db: AsyncSession, prompt_id: int) -> Optional[Prompt]:
+        # 단일 행 조회이므로 joinedload로 한 번의 쿼리에 모두 가져옴
         result = await db.execute(
             select(Prompt)
             .options(
-                selectinload(Prompt.contents).selectinload(PromptContent.section),
-                selectinload(Prompt.template),
-                selectinload(Prompt.gemini_response)
+                joinedload(Prompt.contents).joinedload(PromptContent.section),
+                joinedload(Prompt.gemini_response)
             )
             .where(Prompt.id == prompt_id)
+            .execution_options(populate_existing=True)
         )
-        return result.scalar_one_or_none()
+        return result.unique().scalar_one_or_none()
 
     @staticmethod
     async def delete_prompt(db: AsyncSession, prompt_id: int) -> bool:
-        # 프롬프트가 존재하는지 확인
-        result = await db.execute(select(Prompt).where(Prompt.id == prompt_id))
-        prompt = result.scalar_one_or_none()
-        if not prompt:
-            return False
-
-        # 관련된 PromptContent와 GeminiResponse들을 먼저 삭제
+        # 관련된 PromptContent와 GeminiResponse들을 먼저 삭제 (사전 SELECT 없이 한 트랜잭션으로 처리)
         await db.execute(delete(PromptContent).where(PromptContent.prompt_id == prompt_id))
         await db.execute(delete(GeminiResponse).where(GeminiResponse.prompt_id == prompt_id))
 
-        # 프롬프트 삭제
-        await db.execute(delete(Prompt).where(Prompt.id == prompt_id))
+        # 프롬프트 삭제 - 삭제된 행 수로 존재 여부 판단
+        result = await db.execute(delete(Prompt).where(Prompt.id == prompt_id))
         await db.commit()
 
-        return True
+        return result.rowcount > 0
 
 
 class GeminiService:
     @staticmethod
-    async def create_gemini_response(db: AsyncSession, prompt_id: int) -> GeminiResponse:
+    async def start_gemini_response(db: AsyncSession, prompt_id: int, stale_before: datetime) -> Optional[int]:
+        """응답 레코드를 pending 상태로 준비하고 id 반환, 이미 생성 중이면 None
+
+        stale_before 이전에 시작되어 아직 pending인 응답은 중단된 것으로 보고 다시 시작할 수 있다.
+        """
         # Check if response already exists
         result = await db.execute(
-            select(GeminiResponse).where(GeminiResponse.prompt_id == prompt_id)
+            select(GeminiResponse.id)
+            .where(GeminiResponse.prompt_id == prompt_id)
+            .order_by(GeminiResponse.id.desc())
+            .limit(1)
         )
-        existing_response = result.scalar_one_or_none()
-
-        if existing_response:
-            return existing_response
+        existing_id = result.scalar_one_or_none()
+
+        if existing_id is not None:
+            # 재요청 시 스트리밍으로 다시 채울 수 있도록 초기화 - 생성 중인 응답은 건드리지 않음
+            result = await db.execute(
+                update(GeminiResponse)
+                .where(
+                    GeminiResponse.id == existing_id,
+                    or_(GeminiResponse.status != "pending", GeminiResponse.created_at < stale_before)
+                )
+                .values(response_content="", status="pending", completed_at=None, created_at=local_now())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return existing_id if result.rowcount > 0 else None
 
         # Create new response record
         gemini_response = GeminiResponse(
@@ -231,10 +306,11 @@ class GeminiService:
             status="pending"
         )
         db.add(gemini_response)
+        await db.flush()
+        response_id = gemini_response.id
         await db.commit()
-        await db.refresh(gemini_response)
 
-        return gemini_response
+        return response_id
 
     @staticmethod
     async def update_gemini_response(db: AsyncSession, response_id: int, content: str, status: str) -> Optional[
@@ -255,3 +331,33 @@ class GeminiService:
         await db.commit()
         await db.refresh(response)
         return response
+
+    @staticmethod
+    async def get_gemini_progress(db: AsyncSession, response_id: int, offset: int = 0) -> Optional[Row]:
+        # 이미 전달한 부분(offset 글자) 이후의 내용과 상태만 조회
+        result = await db.execute(
+            select(
+                func.substr(GeminiResponse.response_content, offset + 1).label("new_content"),
+                GeminiResponse.status
+            )
+            .where(GeminiResponse.id == response_id)
+        )
+        return result.one_or_none()
+
+    @staticmethod
+    async def append_chunks(db: AsyncSession, response_id: int, buffered_text: str, status: Optional[str] = None) -> None:
+        # 버퍼링된 조각을 SQL 문자열 연결로 이어붙임 (SELECT 없이 UPDATE 한 번)
+        values = {"response_content": GeminiResponse.response_content + buffered_text}
+        # 마지막 flush에서는 상태 변경도 같은 UPDATE로 처리
+        if status:
+            values["status"] = status
+            if status == "completed":
+                values["completed_at"] = datetime.now()
+
+        await db.execute(
+            update(GeminiResponse)
+            .where(GeminiResponse.id == response_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()